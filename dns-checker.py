@@ -5,30 +5,41 @@ Instruct the user to fix the DNS records with a step-by-step guide.
 """
 from pathlib import Path
 from dataclasses import dataclass
-from typing import List
+from typing import List, Union
+import asyncio
+import dns.asyncresolver
 import dns.resolver
 import argparse
-import yaml
 from enum import Enum
-from itertools import chain
+from yaml_loader import load_index, load_yaml
 
 TARGET_HOSTNAME = "jokeri.ayy.fi"
+MAX_CONCURRENT_DOMAINS = 64
+
+resolver = dns.asyncresolver.Resolver()
+resolver.cache = dns.resolver.LRUCache()
 
 
 def load_subdomains():
     """
     Load the subdomains from subdomains/*.yaml.
+    Uses the index written by subdomain-linter.py when it is up to date.
     """
-    subdomains = []
-    for subdomain_file in chain(
-        Path("subdomains").glob("*.yaml"), Path("subdomains").glob("*.yml")
-    ):
-        with open(subdomain_file, "r") as f:
-            entry = yaml.safe_load(f)
-            for _, value in entry.items():
-                subdomains.extend(value["redirect_from"])
-
-    return subdomains
+    index = load_index("subdomains")
+    if index is not None:
+        entries = [index]
+    else:
+        entries = [
+            load_yaml(path)
+            for path in Path("subdomains").iterdir()
+            if path.suffix in (".yaml", ".yml")
+        ]
+    return [
+        subdomain
+        for entry in entries
+        for _, value in entry.items()
+        for subdomain in value["redirect_from"]
+    ]
 
 
 class FailReasons(Enum):
@@ -54,7 +65,7 @@ class CheckResult:
     fails: List[FailReasons]
 
 
-def check_dns_record(
+async def check_dns_record(
     domain: str, target_ipv4_address: str, target_ipv6_address: str
 ) -> CheckResult:
     """
@@ -73,30 +84,77 @@ def check_dns_record(
             - ipv6_success (bool): True if the IPv6 address matched, False otherwise.
             - fails (list): A list of FailReasons if the check failed, empty otherwise.
     """
+    # Query the IPv4 and IPv6 addresses at the same time
+    ipv4_answers, ipv6_answers = await asyncio.gather(
+        resolver.resolve(domain, "A"),
+        resolver.resolve(domain, "AAAA"),
+        return_exceptions=True,
+    )
+    if isinstance(ipv4_answers, dns.resolver.NXDOMAIN) or isinstance(
+        ipv6_answers, dns.resolver.NXDOMAIN
+    ):
+        return CheckResult(domain, False, False, [FailReasons.NXDOMAIN])
+
     fails = []
-    ipv4_success = False
-    ipv6_success = False
-    try:
-        # Check IPv4 address
-        answers = dns.resolver.query(domain, "A")
-        if answers[0] != target_ipv4_address[0]:
-            fails.append(FailReasons.INCORRECT_IPv4)
-        else:
-            ipv4_success = True
-        # Check IPv6 address
-        answers = dns.resolver.query(domain, "AAAA")
-        if answers[0] != target_ipv6_address[0]:
-            fails.append(FailReasons.INCORRECT_IPv6)
+    successes = []
+    for answers, target_address, incorrect_reason in (
+        (ipv4_answers, target_ipv4_address, FailReasons.INCORRECT_IPv4),
+        (ipv6_answers, target_ipv6_address, FailReasons.INCORRECT_IPv6),
+    ):
+        if isinstance(answers, dns.resolver.NoAnswer):
+            if FailReasons.NOANSWER not in fails:
+                fails.append(FailReasons.NOANSWER)
+            successes.append(False)
+        elif isinstance(answers, BaseException):
+            raise answers
+        elif str(answers[0]) != target_address:
+            fails.append(incorrect_reason)
+            successes.append(False)
         else:
-            ipv6_success = True
-    except dns.resolver.NXDOMAIN:
-        return CheckResult(domain, False, False, [FailReasons.NXDOMAIN])
-    except dns.resolver.NoAnswer:
-        return CheckResult(domain, False, False, [FailReasons.NOANSWER])
+            successes.append(True)
 
+    ipv4_success, ipv6_success = successes
     return CheckResult(domain, ipv4_success, ipv6_success, fails)
 
 
+async def check_dns_records(
+    domains: List[str],
+    target_ipv4_address: str,
+    target_ipv6_address: str,
+    max_concurrent_domains: int = MAX_CONCURRENT_DOMAINS,
+) -> List[Union[CheckResult, BaseException]]:
+    """
+    Check the DNS records of all the given domains concurrently.
+
+    At most max_concurrent_domains domains are being resolved at any one time.
+    The A and AAAA records of a domain are queried together, so up to twice as
+    many queries can be in flight.
+    Unexpected resolver errors are returned in place of the CheckResult of the
+    domain instead of aborting the whole run.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent_domains)
+
+    async def bounded_check(domain: str) -> CheckResult:
+        async with semaphore:
+            return await check_dns_record(
+                domain, target_ipv4_address, target_ipv6_address
+            )
+
+    return await asyncio.gather(
+        *(bounded_check(domain) for domain in domains), return_exceptions=True
+    )
+
+
+def positive_int(value: str) -> int:
+    """
+    Parse a command line argument that must be an integer of at least 1.
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
 def print_fix_instructions(
     fails: List[CheckResult],
     target_cname: str,
@@ -127,20 +185,39 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Check that the DNS records of the subdomains are correctly configured."
     )
+    parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=MAX_CONCURRENT_DOMAINS,
+        help="Maximum number of subdomains to resolve at the same time",
+    )
+    args = parser.parse_args()
 
-    target_ipv4_address = dns.resolver.query(TARGET_HOSTNAME, "A")
-    target_ipv6_address = dns.resolver.query(TARGET_HOSTNAME, "AAAA")
+    target_ipv4_address = str(dns.resolver.resolve(TARGET_HOSTNAME, "A")[0])
+    target_ipv6_address = str(dns.resolver.resolve(TARGET_HOSTNAME, "AAAA")[0])
 
     # Print the target IP addressess
-    print(f"Target IPv4 address: {target_ipv4_address[0]}")
-    print(f"Target IPv6 address: {target_ipv6_address[0]}")
+    print(f"Target IPv4 address: {target_ipv4_address}")
+    print(f"Target IPv6 address: {target_ipv6_address}")
 
-    subdomains = load_subdomains()
+    # The same subdomain may be listed in several files, only check it once
+    subdomains = list(dict.fromkeys(load_subdomains()))
     results = []  # type: List[CheckResult]
-    for subdomain in subdomains:
-        results.append(
-            check_dns_record(subdomain, target_ipv4_address, target_ipv6_address)
-        )
+    for subdomain, result in zip(
+        subdomains,
+        asyncio.run(
+            check_dns_records(
+                subdomains,
+                target_ipv4_address,
+                target_ipv6_address,
+                args.concurrency,
+            )
+        ),
+    ):
+        if not isinstance(result, CheckResult):
+            print(f"Could not check {subdomain}: {result}")
+        else:
+            results.append(result)
     print_fix_instructions(
         results, TARGET_HOSTNAME, target_ipv4_address, target_ipv6_address
     )
@@ -1,8 +1,11 @@
 import os
-from typing import List, Tuple
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 import yaml
 import argparse
 from pprint import pprint
+from yaml_loader import load_yaml, write_index
 
 SUBDOMAINS_FOLDER = "subdomains"
 SUBDOMAIN_VALUE_SCHEMA = {
@@ -11,79 +14,69 @@ SUBDOMAIN_VALUE_SCHEMA = {
     "include_path": {"type": bool, "required": False},
     "permanent": {"type": bool, "required": False},
 }
+SUBDOMAIN_VALUE_TYPES = {key: value["type"] for key, value in SUBDOMAIN_VALUE_SCHEMA.items()}
+REQUIRED_SUBDOMAIN_KEYS = tuple(
+    key for key, value in SUBDOMAIN_VALUE_SCHEMA.items() if value["required"]
+)
 
 
 class LintError(Exception):
     pass
 
 
-def check_yaml_format(file_path):
-    with open(file_path, "r") as f:
-        try:
-            yaml.safe_load(f)
-
-        except yaml.YAMLError as e:
-            raise LintError(f"Error in {file_path}: {e}")
-
-
-def check_business_rules(file_path):
-    with open(file_path, "r") as f:
-        subdomain = yaml.safe_load(f)
-
-        # Check if subdomain is a dict
-        if not isinstance(subdomain, dict):
-            raise LintError(f"{file_path}: Subdomain should be a dict")
-
-        # Check that subdomain has at least one key
-        if len(subdomain) == 0:
-            raise LintError(f"{file_path}: Subdomain should have at least one key")
-
-        subdomain_keys = list(subdomain.keys())
-        # Check if subdomain keys are strings
-        for key in subdomain_keys:
-            if not isinstance(key, str):
-                raise LintError(f"{file_path}: Subdomain key {key} should be a string")
-
-        # Check that the values of the subdomain key are valid
-        for subdomain_key in subdomain_keys:
-            subdomain_value = subdomain[subdomain_key]
-            for key, value in subdomain_value.items():
-                if key not in SUBDOMAIN_VALUE_SCHEMA:
-                    raise LintError(f"{file_path}: {key} is not a valid key")
-                if not isinstance(value, SUBDOMAIN_VALUE_SCHEMA[key]["type"]):
-                    raise LintError(
-                        f"{file_path}: {key} should be a {SUBDOMAIN_VALUE_SCHEMA[key]['type']}"
-                    )
-
-            # Check that the required keys are present
-            for key, value in SUBDOMAIN_VALUE_SCHEMA.items():
-                if value["required"] and key not in subdomain_value:
-                    raise LintError(f"{file_path}: {key} is required")
-
-            # All values in redirect_from should be end with '.ayy.fi' or '.otax.fi'.
-            for redirect_from in subdomain_value["redirect_from"]:
-                if not redirect_from.endswith(".ayy.fi") and not redirect_from.endswith(
-                    ".otax.fi"
-                ):
-                    raise LintError(
-                        f"{file_path}: {redirect_from} should end with '.ayy.fi' or '.otax.fi'"
-                    )
-            
-            # Check that redirect_to is a valid URL
-            if not subdomain_value["redirect_to"].startswith("http"):
-                raise LintError(f"{file_path}: redirect_to should be a valid URL")
-
-
-def get_subdomain_key(file_path):
-    with open(file_path, "r") as f:
-        subdomain = yaml.safe_load(f)
-        subdomain_key = list(subdomain.keys())[0]
-        return subdomain_key
+def check_business_rules(file_path, stat=None) -> Tuple[str, dict]:
+    try:
+        subdomain = load_yaml(file_path, stat)
+    except yaml.YAMLError as e:
+        raise LintError(f"Error in {file_path}: {e}")
+
+    # Check if subdomain is a dict
+    if not isinstance(subdomain, dict):
+        raise LintError(f"{file_path}: Subdomain should be a dict")
+
+    # Check that subdomain has at least one key
+    if len(subdomain) == 0:
+        raise LintError(f"{file_path}: Subdomain should have at least one key")
+
+    subdomain_keys = list(subdomain.keys())
+    # Check if subdomain keys are strings
+    for key in subdomain_keys:
+        if not isinstance(key, str):
+            raise LintError(f"{file_path}: Subdomain key {key} should be a string")
+
+    # Check that the values of the subdomain key are valid
+    for subdomain_key in subdomain_keys:
+        subdomain_value = subdomain[subdomain_key]
+        for key, value in subdomain_value.items():
+            if key not in SUBDOMAIN_VALUE_TYPES:
+                raise LintError(f"{file_path}: {key} is not a valid key")
+            if not isinstance(value, SUBDOMAIN_VALUE_TYPES[key]):
+                raise LintError(
+                    f"{file_path}: {key} should be a {SUBDOMAIN_VALUE_TYPES[key]}"
+                )
+
+        # Check that the required keys are present
+        for key in REQUIRED_SUBDOMAIN_KEYS:
+            if key not in subdomain_value:
+                raise LintError(f"{file_path}: {key} is required")
+
+        # All values in redirect_from should be end with '.ayy.fi' or '.otax.fi'.
+        for redirect_from in subdomain_value["redirect_from"]:
+            if not redirect_from.endswith((".ayy.fi", ".otax.fi")):
+                raise LintError(
+                    f"{file_path}: {redirect_from} should end with '.ayy.fi' or '.otax.fi'"
+                )
+        
+        # Check that redirect_to is a valid URL
+        if not subdomain_value["redirect_to"].startswith(("http://", "https://")):
+            raise LintError(f"{file_path}: redirect_to should be a valid URL")
+
+    return subdomain_keys[0], subdomain
 
 
 def check_no_duplicate_keys(keys_and_filename: List[Tuple[str, str]]):
-    keys = [key for key, _ in keys_and_filename]
-    duplicate_keys = set([key for key in keys if keys.count(key) > 1])
+    key_counts = Counter(key for key, _ in keys_and_filename)
+    duplicate_keys = set(key for key, count in key_counts.items() if count > 1)
     files_with_duplicate_keys = [
         file_name for key, file_name in keys_and_filename if key in duplicate_keys
     ]
@@ -93,23 +86,43 @@ def check_no_duplicate_keys(keys_and_filename: List[Tuple[str, str]]):
         )
 
 
+def _lint_one(
+    file_path, stat
+) -> Tuple[Optional[str], str, Optional[dict], Optional[LintError]]:
+    file_name = os.path.basename(file_path)
+    try:
+        key, subdomain = check_business_rules(file_path, stat)
+        return key, file_name, subdomain, None
+    except LintError as e:
+        return None, file_name, None, e
+
+
 def main(args):
     linting_errors = []
     keys_and_filename = []
-    for file_name in os.listdir(args.folder):
-        if file_name.endswith(".yaml") or file_name.endswith(".yml"):
-            file_path = os.path.join(args.folder, file_name)
-            try:
-                check_yaml_format(file_path)
-                check_business_rules(file_path)
-                keys_and_filename.append((get_subdomain_key(file_path), file_name))
-            except LintError as e:
-                print("Error in file: ", file_path)
-                linting_errors.append(e)
+    file_paths = []
+    file_stats = []
+    with os.scandir(args.folder) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith((".yaml", ".yml")):
+                file_paths.append(entry.path)
+                file_stats.append(entry.stat())
+            else:
+                linting_errors.append(
+                    LintError(f"{entry.name} is not a .yaml or .yml file. Only YAML files are allowed")
+                )
+
+    with ProcessPoolExecutor() as pool:
+        results = list(pool.map(_lint_one, file_paths, file_stats, chunksize=8))
+
+    merged_subdomains = {}
+    for file_path, (key, file_name, subdomain, error) in zip(file_paths, results):
+        if error is not None:
+            print("Error in file: ", file_path)
+            linting_errors.append(error)
         else:
-            linting_errors.append(
-                LintError(f"{file_name} is not a .yaml or .yml file. Only YAML files are allowed")
-            )
+            keys_and_filename.append((key, file_name))
+            merged_subdomains.update(subdomain)
     try:
         check_no_duplicate_keys(keys_and_filename)
     except LintError as e:
@@ -121,6 +134,18 @@ def main(args):
         exit(1)
     else:
         print("No errors found")
+        # The index is only an optimization, failing to write it is not an error
+        try:
+            write_index(
+                args.folder,
+                merged_subdomains,
+                {
+                    os.path.basename(file_path): stat
+                    for file_path, stat in zip(file_paths, file_stats)
+                },
+            )
+        except OSError as e:
+            print(f"Warning: could not write the subdomain index: {e}")
         exit(0)
 
 
@@ -0,0 +1,166 @@
+"""
+Cached loading of the subdomain YAML files, shared by subdomain-linter.py and dns-checker.py.
+"""
+import hashlib
+import json
+import os
+import pickle
+from functools import lru_cache
+from pathlib import Path
+from stat import S_ISDIR, S_IWGRP, S_IWOTH
+from typing import Dict, Optional
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+CACHE_FOLDER_NAME = "ayy-subdomain-redirect"
+
+
+@lru_cache(maxsize=None)
+def _cache_folder() -> Optional[Path]:
+    # Without a home directory (e.g. an arbitrary uid in a container) the pickle
+    # cache is disabled instead of keeping the tools from starting.
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        try:
+            cache_home = Path.home() / ".cache"
+        except (RuntimeError, KeyError):
+            return None
+    return Path(cache_home) / CACHE_FOLDER_NAME
+
+
+def _cache_file(cache_folder: Path, file_path) -> Path:
+    digest = hashlib.md5(os.path.abspath(file_path).encode()).hexdigest()
+    return cache_folder / f"{digest}.pkl"
+
+
+def _cache_folder_is_safe(cache_folder: Path) -> bool:
+    # Unpickling runs code from the cache, so only trust a real directory that
+    # belongs to the current user and that nobody else can write to. Ownership
+    # cannot be checked without os.getuid (e.g. on Windows), so the cache is unused there.
+    if not hasattr(os, "getuid"):
+        return False
+    try:
+        folder_stat = os.lstat(cache_folder)
+    except OSError:
+        return False
+    return (
+        S_ISDIR(folder_stat.st_mode)
+        and folder_stat.st_uid == os.getuid()
+        and not folder_stat.st_mode & (S_IWGRP | S_IWOTH)
+    )
+
+
+@lru_cache(maxsize=256)
+def _load_yaml(file_path, mtime_ns, size):
+    # Reuse the result of an earlier run if the file has not changed since
+    cache_folder = _cache_folder()
+    if cache_folder is not None and _cache_folder_is_safe(cache_folder):
+        try:
+            cache_file = _cache_file(cache_folder, file_path)
+            cached_mtime_ns, cached_size, data = pickle.loads(cache_file.read_bytes())
+            if (cached_mtime_ns, cached_size) == (mtime_ns, size):
+                return data
+        except (OSError, AttributeError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+
+    # libyaml detects the encoding itself, so skip decoding the file in Python
+    data = yaml.load(Path(file_path).read_bytes(), Loader=SafeLoader)
+
+    # The cache is only an optimization, failing to write it is not an error
+    if cache_folder is None or not hasattr(os, "getuid"):
+        return data
+    try:
+        cache_folder.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if not _cache_folder_is_safe(cache_folder):
+            return data
+        cache_file = _cache_file(cache_folder, file_path)
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp_file.write_bytes(pickle.dumps((mtime_ns, size, data)))
+        os.replace(tmp_file, cache_file)
+    except (OSError, AttributeError):
+        pass
+    return data
+
+
+def load_yaml(file_path, stat=None):
+    """
+    Load a YAML file, parsing it only once as long as it is unchanged on disk.
+
+    Parsed files are cached in memory and pickled to the user's cache folder
+    ($XDG_CACHE_HOME or ~/.cache), so that later runs can skip parsing too.
+
+    Args:
+        file_path (str | Path): The file to load.
+        stat (os.stat_result): The stat of the file, if already known.
+    """
+    # The modification time and size are part of the cache key so that
+    # a file changed on disk is parsed again.
+    if stat is None:
+        stat = os.stat(file_path)
+    return _load_yaml(file_path, stat.st_mtime_ns, stat.st_size)
+
+
+def index_file(folder) -> Path:
+    """
+    Return the path of the JSON index of a subdomains folder.
+
+    The index is kept next to the folder rather than inside it, so the folder
+    itself only ever contains the YAML files.
+    """
+    folder = Path(folder).resolve()
+    return folder.parent / f".{folder.name}-index.json"
+
+
+def _source_stats(source_stats: Dict[str, os.stat_result]) -> Dict[str, list]:
+    return {
+        file_name: [stat.st_mtime_ns, stat.st_size]
+        for file_name, stat in source_stats.items()
+    }
+
+
+def write_index(folder, subdomains: dict, source_stats: Dict[str, os.stat_result]):
+    """
+    Write the merged subdomains of a folder to its JSON index.
+
+    Args:
+        folder (str | Path): The subdomains folder.
+        subdomains (dict): All the subdomains of the folder merged into one dict.
+        source_stats (dict): The stat of each YAML file the subdomains were loaded from.
+    """
+    index = {"files": _source_stats(source_stats), "subdomains": subdomains}
+    target_file = index_file(folder)
+    tmp_file = target_file.with_name(f"{target_file.name}.{os.getpid()}.tmp")
+    try:
+        tmp_file.write_text(json.dumps(index))
+        os.replace(tmp_file, target_file)
+    finally:
+        # Do not leave a partially written file behind if the write failed
+        if tmp_file.exists():
+            tmp_file.unlink()
+
+
+def load_index(folder) -> Optional[dict]:
+    """
+    Load the merged subdomains from the JSON index of a folder.
+
+    Returns None if there is no index, or if any YAML file in the folder has been
+    added, removed or changed since the index was written.
+    """
+    try:
+        index = json.loads(index_file(folder).read_text())
+    except (OSError, ValueError):
+        return None
+
+    with os.scandir(folder) as entries:
+        source_stats = {
+            entry.name: entry.stat()
+            for entry in entries
+            if entry.is_file() and entry.name.endswith((".yaml", ".yml"))
+        }
+    if index.get("files") != _source_stats(source_stats):
+        return None
+    return index["subdomains"]